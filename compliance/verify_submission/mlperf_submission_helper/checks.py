@@ -1,9 +1,21 @@
 """Checks to run against a submission."""
 from __future__ import print_function
 
-import json
+import concurrent.futures
 import os
 
+try:
+  import orjson
+  _loads = orjson.loads
+except ImportError:
+  import json
+  _loads = json.loads
+
+try:
+  import ijson
+except ImportError:
+  ijson = None
+
 import constants
 import mlp_compliance.mlp_compliance as mlp_compliance
 import report as subm_report
@@ -11,16 +23,158 @@ import report as subm_report
 INFINITE_TIME = 9999999999.99
 
 
+class _NameSet(frozenset):
+  """Frozenset of names that keeps their original order for display."""
+
+  def __new__(cls, names):
+    name_set = super(_NameSet, cls).__new__(cls, names)
+    name_set.display = str(list(names))
+    return name_set
+
+
+_BENCHMARK_NAMES_SET = _NameSet(constants.BENCHMARK_NAMES)
+_BENCHMARK_NAMES_WITH_SHARED = _NameSet(constants.BENCHMARK_NAMES + ['shared'])
+# Levels of subdirectories listed below each top-level submission dir when
+# indexing: code/<benchmark> and results/<entry>/<benchmark>.
+_INDEXED_DIR_DEPTHS = {'code': 1, 'results': 2}
+_SUBM_META_PROPS_SET = frozenset(constants.SUBM_META_PROPS)
+_ENTRY_META_PROPS_SET = frozenset(constants.ENTRY_META_PROPS)
+_NODE_META_PROPS_SET = frozenset(constants.NODE_META_PROPS)
+_RESULT_ENTRY_META_COLUMNS_SET = frozenset(constants.RESULT_ENTRY_META_COLUMNS)
+
+# entry.json files at least this large are streamed with ijson (if installed)
+# instead of being loaded in full. Below it a full load is faster and the
+# memory saved is negligible.
+_STREAM_ENTRY_META_MIN_SIZE = 8 * 1024 * 1024
+
+
+def _run_compliance(filename):
+  """Runs the mlp_compliance checks on a log file.
+
+  Kept at module level so it can be sent to worker processes.
+
+  Args:
+    filename: Absolute path to the log file.
+
+  Returns:
+    Tuple of (start_time, level, dt, qual, success).
+  """
+  print('Running Compliance Check on {}'.format(filename))
+  print('#' * 80)
+  start_time, status, dt, qual, target = mlp_compliance.l2_check_file_w_starttime(
+      filename)
+  print('#' * 80)
+
+  if status:
+    level = '2'
+  else:
+    start_time, status, dt, qual, target = mlp_compliance.l1_check_file_w_starttime(
+        filename)
+    print('#' * 80)
+    if status:
+      level = '1'
+    else:
+      level = '0'
+
+  success = status and qual and target and qual >= target
+  return start_time, level, dt, qual, success
+
+
+def _stream_entry_meta(f):
+  """Reads entry metadata from `f` without materializing nested values.
+
+  Only what the checks use is kept: top-level scalars, the full values of
+  the columns reported by compile_results(), the names of the other
+  top-level keys (mapped to None) and, for 'nodes', one dict of key names
+  (mapped to None) per node. If the file is not an object with a
+  'nodes' array of objects, it is loaded in full instead so the metadata
+  checks see, and report, the real values.
+
+  Args:
+    f: entry.json opened in binary mode.
+
+  Returns:
+    Dict shaped like the loaded entry metadata, or the fully loaded value.
+  """
+  meta = {}
+  nodes = None
+  # Builders for the reported columns, keyed by top-level key.
+  builders = {}
+  for prefix, event, value in ijson.parse(f, use_float=True):
+    builder = builders.get(prefix.split('.', 1)[0])
+    if builder is not None:
+      builder.event(event, value)
+    elif prefix == '':
+      if event == 'map_key':
+        meta[value] = None
+        if value in _RESULT_ENTRY_META_COLUMNS_SET:
+          builders[value] = ijson.ObjectBuilder()
+      elif event not in ('start_map', 'end_map'):
+        break
+    elif prefix == 'nodes':
+      if event == 'start_array':
+        nodes = []
+      elif event != 'end_array':
+        break
+    elif prefix == 'nodes.item':
+      if event == 'start_map':
+        nodes.append({})
+      elif event == 'map_key':
+        nodes[-1][value] = None
+      elif event != 'end_map':
+        break
+    elif prefix in meta and event in ('string', 'number', 'boolean', 'null'):
+      meta[prefix] = value
+  else:
+    if 'nodes' in meta:
+      meta['nodes'] = nodes
+    for key, builder in builders.items():
+      meta[key] = builder.value
+    return meta
+  f.seek(0)
+  return _loads(f.read())
+
+
+def _load_entry_meta(f):
+  """Loads entry.json, streaming it only when it is large enough to pay off.
+
+  Args:
+    f: entry.json opened in binary mode.
+
+  Returns:
+    The entry metadata.
+  """
+  if (ijson is not None and
+      os.fstat(f.fileno()).st_size >= _STREAM_ENTRY_META_MIN_SIZE):
+    return _stream_entry_meta(f)
+  return _loads(f.read())
+
+
+def _raise_error(e):
+  """os.walk() error handler that stops the walk instead of skipping."""
+  raise e
+
+
 class SubmissionChecks(object):
   """Submission checks."""
 
-  def __init__(self):
+  # Compliance results keyed by (log path, mtime in ns, size) so an unchanged
+  # log is only parsed once per process.
+  _compliance_cache = {}
+
+  def __init__(self, jobs=1):
+    self.jobs = jobs
     self.report = subm_report.SubmissionReport()
     self.submission_meta = {}
     self.result_meta = {}
     self.result_entry_meta = {}
+    # Index of the submission tree, filled by verify_dirs_and_files().
+    # None means exists() falls back to querying the filesystem.
+    self._dir_set = None
+    self._file_set = None
 
   def verify_dirs_and_files(self, root_dir):
+    self._index_files(root_dir)
     self.verify_root_dir(root_dir)
     self.verify_code_dir(root_dir)
     self.verify_results_dir(root_dir)
@@ -33,22 +187,69 @@ class SubmissionChecks(object):
     self.verify_submission_metadata()
     self.verify_result_entry_metadata()
 
+  def _index_files(self, root_dir):
+    """Records the directories and files that exists() is asked about.
+
+    Only root_dir, code/, code/<benchmark>, results/, results/<entry> and
+    results/<entry>/<benchmark> are listed; nothing below them is read, so
+    vendored sources or symlinked datasets are never traversed.
+    DirEntry.is_dir()/is_file() follow symlinks like os.path.isdir/isfile,
+    so a dangling symlink is in neither set.
+    """
+    dir_set = set()
+    file_set = set()
+    try:
+      if os.path.isdir(root_dir):
+        dir_set.add(root_dir)
+      # (directory, levels of subdirectories still to list). None marks
+      # root_dir, whose subdirectories are listed per _INDEXED_DIR_DEPTHS.
+      pending = [(root_dir, None)]
+      while pending:
+        dir_path, depth_left = pending.pop()
+        with os.scandir(dir_path) as it:
+          for entry in it:
+            if entry.is_dir():
+              dir_set.add(entry.path)
+              if depth_left is None:
+                sub_depth = _INDEXED_DIR_DEPTHS.get(entry.name)
+              else:
+                sub_depth = depth_left - 1
+              if sub_depth is not None and sub_depth >= 0:
+                pending.append((entry.path, sub_depth))
+            elif entry.is_file():
+              file_set.add(entry.path)
+    except OSError as e:
+      print('Unable to index {}, checking paths directly: {}'.format(
+          root_dir, str(e)))
+      self._dir_set = None
+      self._file_set = None
+      return
+    self._dir_set = dir_set
+    self._file_set = file_set
+
   def exists(self, path, is_dir=False):
-    exists_fn = os.path.isdir if is_dir else os.path.isfile
-    if exists_fn(path):
+    if self._dir_set is None:
+      exists_fn = os.path.isdir if is_dir else os.path.isfile
+      found = exists_fn(path)
+    else:
+      found = path in (self._dir_set if is_dir else self._file_set)
+    if found:
       self.report.add_passed_check('Path exists: {}'.format(path))
     else:
       self.report.add_failed_check('Path not found: {}'.format(path))
 
-  def name_in(self, path, ref_list):
+  def name_in(self, path, ref_set):
     basename = os.path.basename(path)
-    if basename in ref_list:
-      self.report.add_passed_check('{} name is in {}.'.format(path, ref_list))
+    if basename in ref_set:
+      self.report.add_passed_check('{} name is in {}.'.format(
+          path, ref_set.display))
     else:
-      self.report.add_failed_check('{} name not in {}.'.format(path, ref_list))
+      self.report.add_failed_check('{} name not in {}.'.format(
+          path, ref_set.display))
 
-  def keys_match(self, keys, ref_keys, context=''):
-    different_keys = set(keys).difference(set(ref_keys))
+  def keys_match(self, keys, ref_keys_set, context=''):
+    """Checks `keys` (a set or dict keys view) are all in `ref_keys_set`."""
+    different_keys = keys - ref_keys_set
     if different_keys:
       self.report.add_failed_check('Keys in {} do not match expected: '.format(
           context) + 'unmatched keys: {}'.format(list(different_keys)))
@@ -65,8 +266,8 @@ class SubmissionChecks(object):
     self.exists(submission_meta_file, is_dir=False)
 
     try:
-      with open(submission_meta_file) as f:
-        self.submission_meta = json.load(f)
+      with open(submission_meta_file, 'rb') as f:
+        self.submission_meta = _loads(f.read())
     except Exception as e:
       self.report.add_error('Unable to parse submission meatadata: {}'.format(
           str(e)))
@@ -74,63 +275,112 @@ class SubmissionChecks(object):
   def verify_code_dir(self, root_dir):
     code_root_dir = os.path.join(root_dir, 'code')
     try:
-      for code_name in os.listdir(code_root_dir):
-        code_dir = os.path.join(code_root_dir, code_name)
-        if not os.path.isdir(code_dir):
-          continue
-        self.name_in(code_dir, constants.BENCHMARK_NAMES + ['shared'])
-        if code_name in constants.BENCHMARK_NAMES:
-          self.exists(os.path.join(code_dir, 'README.md'))
-          self.exists(os.path.join(code_dir, 'preproc_dataset.sh'))
+      with os.scandir(code_root_dir) as it:
+        for code_entry in it:
+          if not code_entry.is_dir():
+            continue
+          code_dir = code_entry.path
+          self.name_in(code_dir, _BENCHMARK_NAMES_WITH_SHARED)
+          if code_entry.name in _BENCHMARK_NAMES_SET:
+            self.exists(os.path.join(code_dir, 'README.md'))
+            self.exists(os.path.join(code_dir, 'preproc_dataset.sh'))
     except Exception as e:
       self.report.add_error('Unable to verify code dir: {}'.format(str(e)))
 
   def verify_results_dir(self, root_dir):
-    code_root_dir = os.path.join(root_dir, 'code')
-    result_root_dir = os.path.join(root_dir, 'results')
+    path_join = os.path.join
+    code_root_dir = path_join(root_dir, 'code')
+    result_root_dir = path_join(root_dir, 'results')
+    # (entry_name, result_name, index, log_path, division) for every log.
+    work = []
     try:
-      for entry_name in os.listdir(result_root_dir):
-        entry_dir = os.path.join(result_root_dir, entry_name)
-        if not os.path.isdir(entry_dir):
-          continue
-        entry_meta_file = os.path.join(entry_dir, 'entry.json')
-        try:
-          with open(entry_meta_file) as f:
-            self.result_entry_meta[entry_name] = json.load(f)
-        except Exception as e:
-          self.report.add_error(
-              'Unable to parse result entry metadata: {}'.format(str(e)))
-        self.exists(entry_meta_file)
-        for result_name in os.listdir(entry_dir):
-          result_dir = os.path.join(entry_dir, result_name)
-          if not os.path.isdir(result_dir):
-            continue
-          self.name_in(result_dir, constants.BENCHMARK_NAMES)
+      # Depth 1 is an entry (results/<entry>), depth 2 one of its benchmark
+      # result dirs (results/<entry>/<benchmark>).
+      for dirpath, dirnames, _ in os.walk(result_root_dir,
+                                          onerror=_raise_error,
+                                          followlinks=True):
+        depth = dirpath[len(result_root_dir):].count(os.sep)
+        if depth == 1:
+          entry_name = os.path.basename(dirpath)
+          entry_meta_file = path_join(dirpath, 'entry.json')
+          try:
+            with open(entry_meta_file, 'rb') as f:
+              self.result_entry_meta[entry_name] = _load_entry_meta(f)
+          except Exception as e:
+            self.report.add_error(
+                'Unable to parse result entry metadata: {}'.format(str(e)))
+          self.exists(entry_meta_file)
+        elif depth == 2:
+          del dirnames[:]
+          entry_name = os.path.basename(os.path.dirname(dirpath))
+          result_name = os.path.basename(dirpath)
+          result_dir = dirpath
+          self.name_in(result_dir, _BENCHMARK_NAMES_SET)
+          result_code_dir = path_join(code_root_dir, result_name)
           self.exists(
-              os.path.join(code_root_dir, result_name,
-                           'setup_' + entry_name + '.sh'))
+              path_join(result_code_dir, 'setup_' + entry_name + '.sh'))
           self.exists(
-              os.path.join(code_root_dir, result_name,
-                           'run_and_time_' + entry_name + '.sh'))
+              path_join(result_code_dir,
+                        'run_and_time_' + entry_name + '.sh'))
+          division = self.result_entry_meta.get(entry_name, {}).get(
+              'division')
           result_num = constants.REQUIRED_RESULT_NUM.get(result_name, 0)
           for i in range(result_num):
-            log_file_name = 'result_' + str(i) + '.txt'
-            self.exists(os.path.join(result_dir, log_file_name))
-            self.result_meta.setdefault(entry_name, {})
-            self.result_meta[entry_name].setdefault(
-                result_name, [None for j in range(result_num)])
-            division = self.result_entry_meta[entry_name].get('division')
-            log_path = os.path.join(result_dir, log_file_name)
-            dt, start_time = self.verify_and_extract_time(log_path,
-                                                          division,
-                                                          result_name)
-            self._add_result(self.result_meta[entry_name][result_name],
-                             i,
-                             dt,
-                             start_time)
+            log_file_name = 'result_{}.txt'.format(i)
+            # Plain concatenation: result_dir is already a joined path and
+            # this runs once per log.
+            log_path = result_dir + os.sep + log_file_name
+            self.exists(log_path)
+            work.append((entry_name, result_name, i, log_path, division))
+
+      self._prefetch_compliance([item[3] for item in work])
+      for entry_name, result_name, i, log_path, division in work:
+        # Slots are created as logs are reached, so entries and benchmarks
+        # after a failing log are left out of the results.
+        result_num = constants.REQUIRED_RESULT_NUM[result_name]
+        self.result_meta.setdefault(entry_name, {})
+        self.result_meta[entry_name].setdefault(
+            result_name, [None for j in range(result_num)])
+        dt, start_time = self.verify_and_extract_time(log_path,
+                                                      division,
+                                                      result_name)
+        self._add_result(self.result_meta[entry_name][result_name],
+                         i,
+                         dt,
+                         start_time)
     except Exception as e:
       self.report.add_error('Unable to verify results dir: {}'.format(str(e)))
 
+  def _prefetch_compliance(self, log_files):
+    """Fills the compliance cache for log files using self.jobs processes.
+
+    Logs that fail to check are left out of the cache, so the error is raised
+    again, in order, when verify_and_extract_time() gets to them.
+
+    Args:
+      log_files: List of absolute paths to result logs.
+    """
+    if self.jobs <= 1 or len(log_files) <= 1:
+      return
+    # The pool is only an optimization: if it cannot be created or shut
+    # down (e.g. no /dev/shm), the logs are checked serially instead.
+    try:
+      with concurrent.futures.ProcessPoolExecutor(
+          max_workers=self.jobs) as executor:
+        futures = [(log_file, executor.submit(_run_compliance, log_file))
+                   for log_file in log_files]
+        for log_file, future in futures:
+          try:
+            compliance = future.result()
+            st = os.stat(log_file)
+          except Exception:
+            continue
+          key = (log_file, st.st_mtime_ns, st.st_size)
+          self._compliance_cache[key] = compliance
+    except Exception as e:
+      print('Unable to run compliance checks in parallel, '
+            'checking serially: {}'.format(str(e)))
+
   def _add_result(self, dict_entry, entry, dt, start_time):
     """Adds a result to the dictionary.
 
@@ -165,31 +415,23 @@ class SubmissionChecks(object):
     return results
 
   def verify_submission_metadata(self):
-    subm_meta_keys = self.submission_meta.keys()
-    different_keys = set(subm_meta_keys).difference(
-        set(constants.SUBM_META_PROPS))
-    if different_keys:
-      self.report.add_failed_check(
-          'Keys in submission metadata do not match expected: ' +
-          'unmatched keys: {}'.format(list(different_keys)))
-    else:
-      self.report.add_passed_check(
-          'Keys in submission metadata match expected.')
+    self.keys_match(
+        self.submission_meta.keys(),
+        _SUBM_META_PROPS_SET,
+        context='submission metadata')
 
   def verify_result_entry_metadata(self):
     for entry_name in self.result_entry_meta:
       entry_meta = self.result_entry_meta[entry_name]
-      entry_meta_keys = entry_meta.keys()
       self.keys_match(
-          entry_meta_keys,
-          constants.ENTRY_META_PROPS,
+          entry_meta.keys(),
+          _ENTRY_META_PROPS_SET,
           context='entry {} metadata'.format(entry_name))
       try:
         for node_meta in entry_meta['nodes']:
-          node_meta_keys = node_meta.keys()
           self.keys_match(
-              node_meta_keys,
-              constants.NODE_META_PROPS,
+              node_meta.keys(),
+              _NODE_META_PROPS_SET,
               context='entry {} node metadata'.format(entry_name))
       except Exception as e:
         self.report.add_error(
@@ -251,25 +493,14 @@ class SubmissionChecks(object):
 
   def get_compliance(self, filename):
     """Get the compliance level of the output file."""
-    print('Running Compliance Check on {}'.format(filename))
-    print('#' * 80)
-    start_time, status, dt, qual, target = mlp_compliance.l2_check_file_w_starttime(
-        filename)
-    print('#' * 80)
-
-    if status:
-      level = '2'
-    else:
-      start_time, status, dt, qual, target = mlp_compliance.l1_check_file_w_starttime(
-          filename)
-      print('#' * 80)
-      if status:
-        level = '1'
-      else:
-        level = '0'
-
-    success = status and qual and target and qual >= target
-    return start_time, level, dt, qual, success
+    st = os.stat(filename)
+    key = (filename, st.st_mtime_ns, st.st_size)
+    if key in self._compliance_cache:
+      return self._compliance_cache[key]
+
+    result = _run_compliance(filename)
+    self._compliance_cache[key] = result
+    return result
 
   def verify_and_extract_time(self, log_file, division, result_name):
     """Verifies and result and returns timing.
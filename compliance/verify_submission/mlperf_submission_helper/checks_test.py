@@ -1,14 +1,37 @@
 """Tests checks module."""
 from __future__ import print_function
 
+import io
+import multiprocessing
 import os
+import shutil
+import tempfile
 import unittest
+from unittest import mock
 
 import checks
 
 
+def _fake_check_file_w_starttime(filename):
+  """Compliance check stand-in: the log holds its own run time."""
+  with open(filename) as f:
+    dt = float(f.read())
+  return dt, True, dt, 1.0, 0.5
+
+
+class _FakeCompliance(object):
+  l1_check_file_w_starttime = staticmethod(_fake_check_file_w_starttime)
+  l2_check_file_w_starttime = staticmethod(_fake_check_file_w_starttime)
+
+
 class TestChecks(unittest.TestCase):
 
+  def setUp(self):
+    checks.SubmissionChecks._compliance_cache.clear()
+
+  def tearDown(self):
+    checks.SubmissionChecks._compliance_cache.clear()
+
   def test_verify_and_extract_time_not_success(self):
     """Tests extract the cpu model name."""
     smi_test = 'unittest_files/10_mixed_results/result_7.txt'
@@ -31,6 +54,87 @@ class TestChecks(unittest.TestCase):
     self.assertEqual(dt, 210.3895456790924)
     self.assertEqual(start_time, 1541635651.95072)
 
+  def test_get_compliance_cached(self):
+    """Tests an unchanged log is only checked once."""
+    smi_test = 'unittest_files/10_mixed_results/result_2.txt'
+    smi_test = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), smi_test)
+    compliance = (1541635651.95072, '2', 210.3895456790924, 0.7, True)
+    with mock.patch.object(
+        checks, '_run_compliance', return_value=compliance) as run:
+      first = checks.SubmissionChecks().get_compliance(smi_test)
+      second = checks.SubmissionChecks().get_compliance(smi_test)
+    run.assert_called_once_with(smi_test)
+    self.assertEqual(first, compliance)
+    self.assertEqual(second, compliance)
+
+  @unittest.skipIf(checks.ijson is None, 'ijson is not installed')
+  def test_stream_entry_meta(self):
+    """Tests streamed entry metadata keeps the keys the checks use."""
+    entry = io.BytesIO(b'{"division": "open", "libraries": {"a": 1}, '
+                       b'"nodes": [{"cpu": "x", "notes": {"b": 2}}]}')
+    meta = checks._stream_entry_meta(entry)
+    self.assertEqual(meta['division'], 'open')
+    self.assertIsNone(meta['libraries'])
+    self.assertEqual(list(meta['nodes'][0].keys()), ['cpu', 'notes'])
+
+  @unittest.skipIf(checks.ijson is None, 'ijson is not installed')
+  def test_stream_entry_meta_keeps_reported_columns(self):
+    """Tests reported columns keep their full value when streamed."""
+    entry = io.BytesIO(b'{"division": "open", "hardware": {"gpu": "v100"}, '
+                       b'"libraries": {"a": 1}, "nodes": []}')
+    meta = checks._stream_entry_meta(entry)
+    self.assertEqual(meta['hardware'], {'gpu': 'v100'})
+    self.assertEqual(meta['division'], 'open')
+    self.assertIsNone(meta['libraries'])
+    self.assertEqual(meta['nodes'], [])
+
+  @unittest.skipIf(checks.ijson is None, 'ijson is not installed')
+  def test_load_entry_meta_streams_only_large_files(self):
+    """Tests small entry.json files are loaded in full."""
+    entry_file = tempfile.NamedTemporaryFile(suffix='.json')
+    self.addCleanup(entry_file.close)
+    entry_file.write(b'{"division": "open", "hardware": {"gpu": "v100"}}')
+    entry_file.flush()
+    with mock.patch.object(
+        checks, '_stream_entry_meta', wraps=checks._stream_entry_meta) as stream:
+      with open(entry_file.name, 'rb') as f:
+        small = checks._load_entry_meta(f)
+      self.assertFalse(stream.called)
+      with mock.patch.object(checks, '_STREAM_ENTRY_META_MIN_SIZE', 0):
+        with open(entry_file.name, 'rb') as f:
+          large = checks._load_entry_meta(f)
+      self.assertTrue(stream.called)
+    self.assertEqual(small, large)
+
+  @unittest.skipIf(checks.ijson is None, 'ijson is not installed')
+  def test_stream_entry_meta_floats(self):
+    """Tests streamed numbers are floats, as with a full load."""
+    meta = checks._stream_entry_meta(io.BytesIO(b'{"framework": 1.5}'))
+    self.assertEqual(meta['framework'], 1.5)
+    self.assertIs(type(meta['framework']), float)
+
+  @unittest.skipIf(checks.ijson is None, 'ijson is not installed')
+  def test_stream_entry_meta_bad_nodes(self):
+    """Tests nodes that are not objects are kept and still reported."""
+    entry = io.BytesIO(b'{"division": "open", "nodes": ["a", "b"]}')
+    sub_check = checks.SubmissionChecks()
+    sub_check.result_entry_meta['entry'] = checks._stream_entry_meta(entry)
+    self.assertEqual(sub_check.result_entry_meta['entry']['nodes'],
+                     ['a', 'b'])
+    sub_check.verify_result_entry_metadata()
+    self.assertEqual(len(sub_check.report.errors), 1)
+    self.assertIn('Unable to verify node metadata',
+                  sub_check.report.errors[0])
+
+  @unittest.skipIf(checks.ijson is None, 'ijson is not installed')
+  def test_stream_entry_meta_not_object(self):
+    """Tests a top-level value that is not an object is returned as is."""
+    self.assertEqual(checks._stream_entry_meta(io.BytesIO(b'[1, 2]')), [1, 2])
+    self.assertEqual(
+        checks._stream_entry_meta(io.BytesIO(b'{"nodes": {"cpu": "x"}}')),
+        {'nodes': {'cpu': 'x'}})
+
   def test_add_result(self):
     """Tests adding result to metadata dict."""
     sub_check = checks.SubmissionChecks()
@@ -57,6 +161,196 @@ class TestChecks(unittest.TestCase):
     sorted_results = sub_check._sorted_results(results_dict)
     self.assertEqual(sorted_results, [1, 23, 55, 99])
 
+  def test_exists_uses_file_index(self):
+    """Tests exists() is answered from the submission index."""
+    root_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, root_dir)
+    code_dir = os.path.join(root_dir, 'code', 'resnet')
+    os.makedirs(code_dir)
+    open(os.path.join(code_dir, 'README.md'), 'w').close()
+    sub_check = checks.SubmissionChecks()
+    sub_check._index_files(root_dir)
+    self.assertIn(code_dir, sub_check._dir_set)
+    sub_check.exists(os.path.join(code_dir, 'README.md'))
+    sub_check.exists(os.path.join(code_dir, 'missing.txt'))
+    sub_check.exists(code_dir, is_dir=True)
+    self.assertEqual(len(sub_check.report.passed_checks), 2)
+    self.assertEqual(len(sub_check.report.failed_checks), 1)
+
+  def test_file_index_stays_shallow(self):
+    """Tests the index does not read below the probed directories."""
+    root_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, root_dir)
+    code_dir = os.path.join(root_dir, 'code', 'resnet')
+    vendor_dir = os.path.join(code_dir, 'vendor')
+    result_dir = os.path.join(root_dir, 'results', 'entry', 'resnet')
+    os.makedirs(vendor_dir)
+    os.makedirs(os.path.join(result_dir, 'extra'))
+    open(os.path.join(vendor_dir, 'lib.py'), 'w').close()
+    open(os.path.join(result_dir, 'result_0.txt'), 'w').close()
+    open(os.path.join(result_dir, 'extra', 'notes.txt'), 'w').close()
+    os.symlink(code_dir, os.path.join(code_dir, 'loop'))
+    sub_check = checks.SubmissionChecks()
+    sub_check._index_files(root_dir)
+    self.assertIsNotNone(sub_check._dir_set)
+    self.assertIn(vendor_dir, sub_check._dir_set)
+    self.assertIn(os.path.join(result_dir, 'result_0.txt'),
+                  sub_check._file_set)
+    self.assertNotIn(os.path.join(vendor_dir, 'lib.py'), sub_check._file_set)
+    self.assertNotIn(
+        os.path.join(result_dir, 'extra', 'notes.txt'), sub_check._file_set)
+    self.assertNotIn(os.path.join(code_dir, 'loop', 'vendor'),
+                     sub_check._dir_set)
+
+  def test_name_in(self):
+    """Tests name checks report the reference names in their listed order."""
+    sub_check = checks.SubmissionChecks()
+    sub_check.name_in('/code/shared', checks._BENCHMARK_NAMES_WITH_SHARED)
+    sub_check.name_in('/results/e/shared', checks._BENCHMARK_NAMES_SET)
+    self.assertEqual(sub_check.report.passed_checks, [
+        '/code/shared name is in {}.'.format(
+            checks.constants.BENCHMARK_NAMES + ['shared'])
+    ])
+    self.assertEqual(sub_check.report.failed_checks, [
+        '/results/e/shared name not in {}.'.format(
+            checks.constants.BENCHMARK_NAMES)
+    ])
+
+  def test_file_index_skips_broken_symlinks(self):
+    """Tests a dangling symlink is reported as not found, like isfile()."""
+    root_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, root_dir)
+    link = os.path.join(root_dir, 'README.md')
+    os.symlink(os.path.join(root_dir, 'nonexistent'), link)
+    sub_check = checks.SubmissionChecks()
+    sub_check._index_files(root_dir)
+    sub_check.exists(link)
+    self.assertEqual(sub_check.report.failed_checks,
+                     ['Path not found: {}'.format(link)])
+
+  def test_verify_results_dir_broken_symlinks(self):
+    """Tests dangling entry.json and result logs are reported as missing."""
+    root_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, root_dir)
+    result_dir = os.path.join(root_dir, 'results', 'entry', 'resnet')
+    os.makedirs(result_dir)
+    entry_meta_file = os.path.join(root_dir, 'results', 'entry', 'entry.json')
+    log_file = os.path.join(result_dir, 'result_0.txt')
+    for link in (entry_meta_file, log_file):
+      os.symlink(os.path.join(root_dir, 'nonexistent'), link)
+    sub_check = checks.SubmissionChecks()
+    sub_check.verify_dirs_and_files(root_dir)
+    self.assertIn('Path not found: {}'.format(entry_meta_file),
+                  sub_check.report.failed_checks)
+    self.assertIn('Path not found: {}'.format(log_file),
+                  sub_check.report.failed_checks)
+
+  @unittest.skipIf(multiprocessing.get_start_method() != 'fork',
+                   'workers need the patched compliance module')
+  def test_verify_results_dir_parallel_matches_serial(self):
+    """Tests --jobs gives the same results and errors as a serial run."""
+    root_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, root_dir)
+    for entry_name in ('entry_a', 'entry_b'):
+      result_dir = os.path.join(root_dir, 'results', entry_name, 'resnet')
+      os.makedirs(result_dir)
+      with open(os.path.join(root_dir, 'results', entry_name, 'entry.json'),
+                'w') as f:
+        f.write('{"division": "closed"}')
+      for i in range(5):
+        if entry_name == 'entry_a' and i == 3:
+          continue
+        with open(os.path.join(result_dir, 'result_{}.txt'.format(i)),
+                  'w') as f:
+          f.write(str(10.0 + i))
+
+    sub_checks = []
+    with mock.patch.object(checks, 'mlp_compliance', _FakeCompliance):
+      for jobs in (1, 2):
+        checks.SubmissionChecks._compliance_cache.clear()
+        sub_check = checks.SubmissionChecks(jobs=jobs)
+        sub_check.verify_results_dir(root_dir)
+        sub_check.submission_meta = {'org': 'org'}
+        for entry_meta in sub_check.result_entry_meta.values():
+          entry_meta.update(status='', hardware='', framework='')
+        sub_check.compile_results()
+        sub_checks.append(sub_check)
+
+    serial, parallel = sub_checks
+    self.assertEqual(parallel.result_meta, serial.result_meta)
+    self.assertEqual(parallel.report.errors, serial.report.errors)
+    self.assertEqual(parallel.report.results, serial.report.results)
+    none_errors = [
+        e for e in serial.report.errors
+        if e.startswith('Benchmark results contain None values')
+    ]
+    self.assertEqual(len(none_errors), 1)
+
+  def test_verify_results_dir_pool_failure_falls_back(self):
+    """Tests logs are still checked serially when the pool cannot start."""
+    root_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, root_dir)
+    result_dir = os.path.join(root_dir, 'results', 'entry', 'resnet')
+    os.makedirs(result_dir)
+    with open(os.path.join(root_dir, 'results', 'entry', 'entry.json'),
+              'w') as f:
+      f.write('{"division": "closed"}')
+    for i in range(5):
+      with open(os.path.join(result_dir, 'result_{}.txt'.format(i)), 'w') as f:
+        f.write(str(10.0 + i))
+
+    sub_check = checks.SubmissionChecks(jobs=2)
+    with mock.patch.object(checks, 'mlp_compliance', _FakeCompliance), \
+        mock.patch.object(checks.concurrent.futures, 'ProcessPoolExecutor',
+                          side_effect=NotImplementedError('no sem_open')):
+      sub_check.verify_results_dir(root_dir)
+    self.assertEqual(sub_check.report.errors, [])
+    self.assertEqual(
+        [r['dt'] for r in sub_check.result_meta['entry']['resnet']],
+        [10.0, 11.0, 12.0, 13.0, 14.0])
+
+  def test_compile_results_drops_min_and_max(self):
+    """Tests the result is the mean without the best and worst runs."""
+    sub_check = checks.SubmissionChecks()
+    sub_check.submission_meta = {'org': 'org'}
+    sub_check.result_entry_meta['entry'] = {
+        'division': 'closed',
+        'status': 'available',
+        'hardware': 'hw',
+        'framework': 'fw'
+    }
+    sub_check.result_meta['entry'] = {
+        'resnet': [
+            self._create_result_dict(dt, start_time)
+            for start_time, dt in enumerate([30, 10, 50, 20, 40])
+        ]
+    }
+    sub_check.compile_results()
+    results = sub_check.report.results['entry']
+    self.assertEqual(results['resnet'], 30.0)
+    self.assertIsNone(results['ncf'])
+
+  def test_compile_results_with_infinite_time(self):
+    """Tests a failed run as the max does not change the trimmed mean."""
+    sub_check = checks.SubmissionChecks()
+    sub_check.submission_meta = {'org': 'org'}
+    sub_check.result_entry_meta['entry'] = {
+        'division': 'closed',
+        'status': 'available',
+        'hardware': 'hw',
+        'framework': 'fw'
+    }
+    dts = [31.101, checks.INFINITE_TIME, 31.3, 29.9, 31.517]
+    sub_check.result_meta['entry'] = {
+        'resnet': [
+            self._create_result_dict(dt, start_time)
+            for start_time, dt in enumerate(dts)
+        ]
+    }
+    sub_check.compile_results()
+    results = sub_check.report.results['entry']
+    self.assertEqual(results['resnet'], (31.101 + 31.3 + 31.517) / 3)
+
   def _create_result_dict(self, dt, start_time):
     result = {}
     result['dt'] = dt
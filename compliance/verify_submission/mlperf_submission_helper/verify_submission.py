@@ -14,6 +14,7 @@ def verify_submission(args):
   private_key = args.private_key
   encrypt_out = args.encrypt_out
   decrypt_out = args.decrypt_out
+  jobs = args.jobs
 
   # validate args
   if any([public_key, encrypt_out]) and not all([public_key, encrypt_out]):
@@ -22,6 +23,9 @@ def verify_submission(args):
   if any([private_key, decrypt_out]) and not all([private_key, decrypt_out]):
     print("--decrypt-key and --decrypt-out must be present together.")
     sys.exit(1)
+  if jobs < 1:
+    print("--jobs must be at least 1.")
+    sys.exit(1)
   if all([private_key, public_key]):
     print("--encrypt-key and --decrypt-key cannot be present together.")
     sys.exit(1)
@@ -41,7 +45,7 @@ def verify_submission(args):
     root_dir = decrypt_out
 
   # perform verifications and extract results
-  checks = submission_checks.SubmissionChecks()
+  checks = submission_checks.SubmissionChecks(jobs=jobs)
   checks.verify_dirs_and_files(root_dir)
   checks.verify_metadata()
   checks.compile_results()
@@ -84,6 +88,14 @@ def main():
       dest="decrypt_out",
       default=None,
       help="output path for decrypted submission")
+  parser.add_argument(
+      "-j",
+      "--jobs",
+      dest="jobs",
+      type=int,
+      default=1,
+      help="number of processes used to run log compliance checks; with " +
+      "more than 1, compliance output from the workers is interleaved")
   args = parser.parse_args()
 
   verify_submission(args)